@@ -4,22 +4,189 @@ import subprocess
 import time
 from typing import Dict, List, Optional
 
+from ppadb.client import Client as AdbClient
+
 from .utils import setup_logger
 
 
+# Android keycodes, stored in both cases so press_key lookups skip
+# per-call case normalization
+_KEY_CODES = {
+    'HOME': '3',
+    'BACK': '4',
+    'ENTER': '66',
+    'DELETE': '67',
+    'MENU': '82',
+    'POWER': '26',
+    'VOLUME_UP': '24',
+    'VOLUME_DOWN': '25'
+}
+_KEY_CODES.update({key.lower(): code for key, code in list(_KEY_CODES.items())})
+
+
 class ActionExecutor:
     """Executes actions on Android device via ADB."""
     
     def __init__(self, config: Dict):
         """Initialize action executor.
-        
+
         Args:
             config: Configuration dictionary
         """
         self.logger = setup_logger(__name__, config.get('log_level', 'INFO'))
         self.config = config
         self.device_id = config.get('device_id')
-    
+        self._shell: Optional[subprocess.Popen] = None
+        self.device = self._connect_ppadb()
+
+        # O(1) action dispatch instead of an if/elif chain per action
+        self._dispatch = {
+            'tap': lambda a: self.tap(a['x'], a['y']),
+            'swipe': lambda a: self.swipe(
+                a['x1'], a['y1'], a['x2'], a['y2'], a.get('duration', 300)
+            ),
+            'text_input': lambda a: self.input_text(a['text']),
+            'key_event': lambda a: self.press_key(a['key']),
+            'long_press': lambda a: self.long_press(
+                a['x'], a['y'], a.get('duration', 1000)
+            ),
+            'wait': lambda a: time.sleep(a.get('duration', 1)) or True,
+            'task_complete': lambda a: True
+        }
+
+    def _connect_ppadb(self):
+        """Resolve the device through the adb server's persistent connection.
+
+        All commands issued through the returned device travel over the
+        single multiplexed TCP connection to the adb server, avoiding a
+        per-call adb binary spawn.
+
+        Returns:
+            ppadb Device object, or None if the adb server is unreachable
+        """
+        try:
+            client = AdbClient(host='127.0.0.1', port=5037)
+            devices = client.devices()
+
+            if not devices:
+                self.logger.warning("No devices visible to adb server")
+                return None
+
+            if self.device_id:
+                device = next(
+                    (d for d in devices if d.serial == self.device_id), None
+                )
+                if device is None:
+                    self.logger.warning(f"Device {self.device_id} not found")
+                return device
+
+            return devices[0]
+
+        except Exception as e:
+            self.logger.warning(
+                f"adb server unavailable ({e}), falling back to adb shell session"
+            )
+            return None
+
+    def _ensure_shell(self) -> Optional[subprocess.Popen]:
+        """Lazily start (or restart) the persistent `adb shell` session.
+
+        Returns:
+            Running Popen object, or None if the session could not start
+        """
+        if self._shell is not None and self._shell.poll() is None:
+            return self._shell
+
+        adb_cmd = ['adb']
+        if self.device_id:
+            adb_cmd.extend(['-s', self.device_id])
+        adb_cmd.append('shell')
+
+        try:
+            self._shell = subprocess.Popen(
+                adb_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=1,
+                text=True
+            )
+        except OSError as e:
+            self.logger.error(f"Failed to start adb shell session: {e}")
+            self._shell = None
+
+        return self._shell
+
+    def _send(self, command: str) -> bool:
+        """Run a shell command on the persistent session.
+
+        Writes the command followed by an exit-status marker and reads
+        output until the marker comes back, avoiding a new adb process
+        per action.
+
+        Args:
+            command: Shell command string (e.g. 'input tap 100 200')
+
+        Returns:
+            True if the command exited with status 0, False otherwise
+        """
+        if self.device is not None:
+            try:
+                output = self.device.shell(f"{command}; echo __R__$?") or ''
+                idx = output.rfind('__R__')
+                exit_code = int(output[idx + 5:].strip() or '1') if idx >= 0 else 1
+                if exit_code != 0:
+                    self.logger.error(
+                        f"Shell command failed (exit {exit_code}): {command}"
+                    )
+                return exit_code == 0
+            except Exception as e:
+                self.logger.warning(
+                    f"ppadb shell error: {e}, falling back to adb shell session"
+                )
+                self.device = None
+
+        shell = self._ensure_shell()
+        if shell is None:
+            # Persistent session unavailable, fall back to one-shot adb
+            return self._run_adb_command(['shell', command])
+
+        try:
+            shell.stdin.write(f"{command}; echo __R__$?\n")
+            shell.stdin.flush()
+
+            while True:
+                line = shell.stdout.readline()
+                if not line:
+                    # Shell died mid-command
+                    raise BrokenPipeError("adb shell session closed")
+                line = line.strip()
+                if line.startswith('__R__'):
+                    exit_code = int(line[5:] or '1')
+                    if exit_code != 0:
+                        self.logger.error(
+                            f"Shell command failed (exit {exit_code}): {command}"
+                        )
+                    return exit_code == 0
+
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Persistent shell error: {e}, retrying one-shot")
+            self._close_shell()
+            return self._run_adb_command(['shell', command])
+
+    def _close_shell(self):
+        """Close the persistent shell session if running."""
+        if self._shell is None:
+            return
+        try:
+            if self._shell.stdin:
+                self._shell.stdin.close()
+            self._shell.terminate()
+            self._shell.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._shell.kill()
+        self._shell = None
+
     def _run_adb_command(self, command: List[str]) -> bool:
         """Run an ADB command.
         
@@ -29,18 +196,31 @@ class ActionExecutor:
         Returns:
             True if successful, False otherwise
         """
+        adb_cmd = ['adb']
+        if self.device_id:
+            adb_cmd.extend(['-s', self.device_id])
+        adb_cmd.extend(command)
+
         try:
-            adb_cmd = ['adb']
-            if self.device_id:
-                adb_cmd.extend(['-s', self.device_id])
-            adb_cmd.extend(command)
-            
-            subprocess.run(adb_cmd, capture_output=True, check=True)
-            return True
-            
-        except subprocess.CalledProcessError as e:
+            # Only the exit status matters for input commands; skip the
+            # pipe setup and stream draining capture_output would cost
+            proc = subprocess.run(
+                adb_cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False
+            )
+        except OSError as e:
             self.logger.error(f"ADB command failed: {e}")
             return False
+
+        if proc.returncode != 0:
+            self.logger.error(
+                f"ADB command failed (exit {proc.returncode}): {' '.join(command)}"
+            )
+            return False
+
+        return True
     
     def execute(self, action: Dict) -> bool:
         """Execute an action on the device.
@@ -51,31 +231,76 @@ class ActionExecutor:
         Returns:
             True if action executed successfully, False otherwise
         """
+        handler = self._dispatch.get(action.get('type'))
+
+        if handler is None:
+            self.logger.warning(f"Unknown action type: {action.get('type')}")
+            return False
+
+        return handler(action)
+
+    def _action_to_command(self, action: Dict) -> Optional[str]:
+        """Translate an action into a shell command fragment.
+
+        Args:
+            action: Action dictionary with type and parameters
+
+        Returns:
+            Shell command string, or None if the action cannot be batched
+        """
         action_type = action.get('type')
-        
+
         if action_type == 'tap':
-            return self.tap(action['x'], action['y'])
+            return f"input tap {action['x']} {action['y']}"
         elif action_type == 'swipe':
-            return self.swipe(
-                action['x1'], action['y1'],
-                action['x2'], action['y2'],
-                action.get('duration', 300)
-            )
+            return (f"input swipe {action['x1']} {action['y1']} "
+                    f"{action['x2']} {action['y2']} {action.get('duration', 300)}")
         elif action_type == 'text_input':
-            return self.input_text(action['text'])
+            return f"input text {action['text'].replace(' ', '%s')}"
         elif action_type == 'key_event':
-            return self.press_key(action['key'])
+            return f"input keyevent {self._key_to_code(action['key'])}"
         elif action_type == 'long_press':
-            return self.long_press(action['x'], action['y'], action.get('duration', 1000))
+            x, y = action['x'], action['y']
+            return f"input swipe {x} {y} {x} {y} {action.get('duration', 1000)}"
         elif action_type == 'wait':
-            time.sleep(action.get('duration', 1))
-            return True
-        elif action_type == 'task_complete':
-            return True
+            return f"sleep {action.get('duration', 1)}"
         else:
-            self.logger.warning(f"Unknown action type: {action_type}")
-            return False
-    
+            return None
+
+    def execute_batch(self, actions: List[Dict]) -> bool:
+        """Execute a sequence of actions in a single shell invocation.
+
+        Joins batchable actions with ';' so the whole plan costs one
+        ADB round-trip instead of one per action. Actions that cannot
+        be expressed as a shell fragment are executed individually.
+
+        Args:
+            actions: List of action dictionaries
+
+        Returns:
+            True if all actions executed successfully, False otherwise
+        """
+        commands = []
+
+        for action in actions:
+            command = self._action_to_command(action)
+            if command is None:
+                # Flush pending batch, then run the odd one out directly
+                if commands:
+                    if not self._send('; '.join(commands)):
+                        return False
+                    commands = []
+                if not self.execute(action):
+                    return False
+            else:
+                commands.append(command)
+
+        if commands:
+            self.logger.info(f"Executing batch of {len(commands)} commands")
+            return self._send('; '.join(commands))
+
+        return True
+
     def tap(self, x: int, y: int) -> bool:
         """Tap at specified coordinates.
         
@@ -87,9 +312,7 @@ class ActionExecutor:
             True if successful
         """
         self.logger.info(f"Tapping at ({x}, {y})")
-        return self._run_adb_command(
-            ['shell', 'input', 'tap', str(x), str(y)]
-        )
+        return self._send(f'input tap {x} {y}')
     
     def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 300) -> bool:
         """Swipe from one point to another.
@@ -105,9 +328,7 @@ class ActionExecutor:
             True if successful
         """
         self.logger.info(f"Swiping from ({x1}, {y1}) to ({x2}, {y2})")
-        return self._run_adb_command(
-            ['shell', 'input', 'swipe', str(x1), str(y1), str(x2), str(y2), str(duration)]
-        )
+        return self._send(f'input swipe {x1} {y1} {x2} {y2} {duration}')
     
     def input_text(self, text: str) -> bool:
         """Input text (requires focused text field).
@@ -121,9 +342,7 @@ class ActionExecutor:
         # Replace spaces with %s for ADB
         text_escaped = text.replace(' ', '%s')
         self.logger.info(f"Inputting text: {text}")
-        return self._run_adb_command(
-            ['shell', 'input', 'text', text_escaped]
-        )
+        return self._send(f'input text {text_escaped}')
     
     def press_key(self, key: str) -> bool:
         """Press a hardware key.
@@ -134,22 +353,19 @@ class ActionExecutor:
         Returns:
             True if successful
         """
-        key_codes = {
-            'HOME': '3',
-            'BACK': '4',
-            'ENTER': '66',
-            'DELETE': '67',
-            'MENU': '82',
-            'POWER': '26',
-            'VOLUME_UP': '24',
-            'VOLUME_DOWN': '25'
-        }
-        
-        key_code = key_codes.get(key.upper(), key)
         self.logger.info(f"Pressing key: {key}")
-        return self._run_adb_command(
-            ['shell', 'input', 'keyevent', key_code]
-        )
+        return self._send(f'input keyevent {self._key_to_code(key)}')
+
+    def _key_to_code(self, key: str) -> str:
+        """Translate a key name to its Android keycode.
+
+        Args:
+            key: Key name (HOME, BACK, ENTER, etc.)
+
+        Returns:
+            Keycode string, or the key unchanged if not a known name
+        """
+        return _KEY_CODES.get(key, key)
     
     def long_press(self, x: int, y: int, duration: int = 1000) -> bool:
         """Long press at specified coordinates.
@@ -163,7 +379,7 @@ class ActionExecutor:
             True if successful
         """
         self.logger.info(f"Long pressing at ({x}, {y}) for {duration}ms")
-        return self.swipe(x, y, x, y, duration)
+        return self._send(f'input swipe {x} {y} {x} {y} {duration}')
     
     def scroll_down(self, x: int, y: int, distance: int = 500) -> bool:
         """Scroll down from a point.
@@ -193,4 +409,5 @@ class ActionExecutor:
     
     def cleanup(self):
         """Cleanup resources."""
+        self._close_shell()
         self.logger.info("Action executor cleanup completed")
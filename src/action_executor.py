@@ -2,11 +2,118 @@
 
 import logging
 import time
-from typing import Dict, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 
 from ppadb.client import Client as AdbClient
 
 
+# Android keycodes, stored in both cases so lookups need no per-call
+# case normalization
+_KEY_CODES = {
+    'home': 3,
+    'back': 4,
+    'enter': 66,
+    'menu': 82,
+    'power': 26,
+    'volume_up': 24,
+    'volume_down': 25,
+    'tab': 61,
+    'space': 62,
+    'delete': 67
+}
+_KEY_CODES.update({key.upper(): code for key, code in list(_KEY_CODES.items())})
+
+
+# Prebound shell command templates so the hot path skips per-call
+# f-string formatting setup
+_TAP = "input tap {} {}".format
+_SWIPE = "input swipe {} {} {} {} {}".format
+_TEXT = "input text {}".format
+_KEY = "input keyevent {}".format
+_SLEEP = "sleep {}".format
+
+
+# Shared ADB connections so repeated agent constructions reuse one
+# client and device handle instead of re-handshaking per instance
+_CLIENT_CACHE: Dict[Tuple[str, int], AdbClient] = {}
+_DEVICE_CACHE: Dict[Tuple[str, int, Optional[str]], object] = {}
+
+
+def _action_to_command(action: Dict) -> str:
+    """Translate an action dict into a shell command fragment"""
+    action_type = action.get('type')
+
+    if action_type == 'tap':
+        return _TAP(action['x'], action['y'])
+    elif action_type == 'swipe':
+        return _SWIPE(action['x1'], action['y1'],
+                      action['x2'], action['y2'], action.get('duration', 300))
+    elif action_type == 'text_input':
+        return _TEXT(action['text'].replace(' ', '%s'))
+    elif action_type == 'key_event':
+        return _KEY(_KEY_CODES.get(action['key'], action['key']))
+    elif action_type == 'long_press':
+        x, y = action['x'], action['y']
+        return _SWIPE(x, y, x, y, action.get('duration', 1000))
+    elif action_type == 'wait':
+        return _SLEEP(action.get('duration', 1))
+    else:
+        raise ValueError(f"Cannot batch action type: {action_type}")
+
+
+def _validate(device) -> bool:
+    """Cheap liveness check for a cached device handle"""
+    try:
+        device.shell('echo 1')
+        return True
+    except Exception:
+        return False
+
+
+def _get_or_connect(host: str, port: int, serial: Optional[str]):
+    """Return a cached (client, device) pair, connecting on first use.
+
+    Args:
+        host: adb server host
+        port: adb server port
+        serial: Device serial, or None for the first available device
+
+    Returns:
+        Tuple of (AdbClient, Device)
+    """
+    client = _CLIENT_CACHE.get((host, port))
+    if client is None:
+        client = AdbClient(host=host, port=port)
+        _CLIENT_CACHE[(host, port)] = client
+
+    device_key = (host, port, serial)
+    device = _DEVICE_CACHE.get(device_key)
+
+    # Drop stale handles (adb server restarted, device re-plugged)
+    if device is not None and not _validate(device):
+        _DEVICE_CACHE.pop(device_key, None)
+        device = None
+
+    if device is None:
+        devices = client.devices()
+
+        if not devices:
+            raise RuntimeError("No Android devices connected")
+
+        if serial:
+            device = next((d for d in devices if d.serial == serial), None)
+            if not device:
+                raise RuntimeError(f"Device {serial} not found")
+        else:
+            device = devices[0]
+
+        _DEVICE_CACHE[device_key] = device
+
+    return client, device
+
+
 class ActionExecutor:
     """Executes actions on Android device via ADB"""
     
@@ -14,33 +121,66 @@ class ActionExecutor:
         self.config = config
         self.logger = logging.getLogger(__name__)
         
-        # Connect to ADB
-        self.adb_client = AdbClient(host="127.0.0.1", port=5037)
-        self.device = self._connect_device()
-        
-    def _connect_device(self):
-        """Connect to Android device via ADB"""
-        devices = self.adb_client.devices()
-        
-        if not devices:
-            raise RuntimeError("No Android devices connected")
-        
-        device_serial = self.config['adb'].get('device_serial')
-        
-        if device_serial:
-            device = next((d for d in devices if d.serial == device_serial), None)
-            if not device:
-                raise RuntimeError(f"Device {device_serial} not found")
-        else:
-            device = devices[0]
-        
-        return device
+        # Connect to ADB (shared across instances via the module caches)
+        self.adb_client, self.device = _get_or_connect(
+            "127.0.0.1", 5037, self.config['adb'].get('device_serial')
+        )
+
+        # Fire-and-forget worker for actions whose outcome the agent
+        # does not react to
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
     
+    def execute_batch(self, actions: list) -> bool:
+        """Execute multiple actions in one shell invocation
+
+        Joins the actions with ';' and issues a single device.shell call,
+        amortizing the ADB round-trip across the whole plan.
+        """
+        try:
+            command = '; '.join(_action_to_command(a) for a in actions)
+            self.logger.debug(f"Executing batch: {command}")
+            self.device.shell(command)
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to execute batch: {str(e)}")
+            return False
+
+    def execute_async(self, action: Dict) -> bool:
+        """Submit an action without waiting for the device round-trip
+
+        Intended for non-critical actions (trailing waits, end-of-task
+        key presses). Call flush() before the next screen capture so
+        pending actions land before perception runs.
+        """
+        try:
+            command = _action_to_command(action)
+        except ValueError as e:
+            self.logger.error(str(e))
+            return False
+
+        self._pending.append(self._io_pool.submit(self.device.shell, command))
+        return True
+
+    def flush(self) -> bool:
+        """Wait for all fire-and-forget actions to complete"""
+        success = True
+
+        while self._pending:
+            future = self._pending.popleft()
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"Async action failed: {str(e)}")
+                success = False
+
+        return success
+
     def tap(self, x: int, y: int) -> bool:
         """Tap at coordinates (x, y)"""
         try:
             self.logger.debug(f"Tapping at ({x}, {y})")
-            self.device.shell(f"input tap {x} {y}")
+            self.device.shell(_TAP(x, y))
             return True
         except Exception as e:
             self.logger.error(f"Failed to tap at ({x}, {y}): {str(e)}")
@@ -50,7 +190,7 @@ class ActionExecutor:
         """Swipe from (start_x, start_y) to (end_x, end_y)"""
         try:
             self.logger.debug(f"Swiping from ({start_x}, {start_y}) to ({end_x}, {end_y})")
-            self.device.shell(f"input swipe {start_x} {start_y} {end_x} {end_y} {duration}")
+            self.device.shell(_SWIPE(start_x, start_y, end_x, end_y, duration))
             return True
         except Exception as e:
             self.logger.error(f"Failed to swipe: {str(e)}")
@@ -62,7 +202,7 @@ class ActionExecutor:
             # Escape spaces and special characters
             escaped_text = text.replace(' ', '%s')
             self.logger.debug(f"Inputting text: {text}")
-            self.device.shell(f"input text {escaped_text}")
+            self.device.shell(_TEXT(escaped_text))
             return True
         except Exception as e:
             self.logger.error(f"Failed to input text: {str(e)}")
@@ -70,27 +210,14 @@ class ActionExecutor:
     
     def press_key(self, key: str) -> bool:
         """Press hardware key (home, back, enter, etc.)"""
-        key_codes = {
-            'home': 3,
-            'back': 4,
-            'enter': 66,
-            'menu': 82,
-            'power': 26,
-            'volume_up': 24,
-            'volume_down': 25,
-            'tab': 61,
-            'space': 62,
-            'delete': 67
-        }
-        
         try:
-            key_code = key_codes.get(key.lower())
+            key_code = _KEY_CODES.get(key)
             if key_code is None:
                 self.logger.error(f"Unknown key: {key}")
                 return False
             
             self.logger.debug(f"Pressing key: {key}")
-            self.device.shell(f"input keyevent {key_code}")
+            self.device.shell(_KEY(key_code))
             return True
         except Exception as e:
             self.logger.error(f"Failed to press key {key}: {str(e)}")
@@ -100,7 +227,7 @@ class ActionExecutor:
         """Long press at coordinates"""
         try:
             self.logger.debug(f"Long pressing at ({x}, {y}) for {duration}ms")
-            self.device.shell(f"input swipe {x} {y} {x} {y} {duration}")
+            self.device.shell(_SWIPE(x, y, x, y, duration))
             return True
         except Exception as e:
             self.logger.error(f"Failed to long press: {str(e)}")
@@ -143,9 +270,109 @@ class ActionExecutor:
     def get_current_activity(self) -> str:
         """Get currently running activity"""
         try:
+            # Targeted query returns a single line instead of the full
+            # multi-KB window manager dump
+            output = self.device.shell(
+                "dumpsys activity activities | grep -m1 topResumedActivity"
+            )
+            if output and output.strip():
+                return output.strip()
+
+            # Older Android versions: fall back to the window dump
             output = self.device.shell("dumpsys window windows | grep -E 'mCurrentFocus'")
-            # Extract package/activity from output
             return output.strip()
         except Exception as e:
             self.logger.error(f"Failed to get current activity: {str(e)}")
             return ""
+
+    def is_on_home(self) -> bool:
+        """Check whether the launcher is currently in the foreground"""
+        activity = self.get_current_activity().lower()
+        return 'launcher' in activity or '.home' in activity
+
+    def go_home(self) -> bool:
+        """Press HOME unless the launcher is already in the foreground
+
+        Skipping the redundant keyevent also skips the UI-settle wait
+        the caller would pay after it.
+        """
+        if self.is_on_home():
+            self.logger.debug("Already on home screen, skipping HOME press")
+            return True
+        return self.press_key('home')
+
+
+class MultiDeviceExecutor:
+    """Fans the same action out to several devices concurrently
+
+    All devices share the single multiplexed AdbClient connection, and
+    each action is broadcast through a thread pool so wall time is the
+    slowest device's round-trip rather than the sum.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+
+        serials = config['adb'].get('device_serials') or []
+
+        if serials:
+            self.devices = [
+                _get_or_connect("127.0.0.1", 5037, serial)[1]
+                for serial in serials
+            ]
+        else:
+            client, _ = _get_or_connect("127.0.0.1", 5037, None)
+            self.devices = client.devices()
+
+        if not self.devices:
+            raise RuntimeError("No Android devices connected")
+
+        self.pool = ThreadPoolExecutor(max_workers=len(self.devices))
+
+    def _broadcast(self, command: str) -> bool:
+        """Run one shell command on every device in parallel"""
+        futures = [self.pool.submit(d.shell, command) for d in self.devices]
+        success = True
+
+        for device, future in zip(self.devices, futures):
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"Device {device.serial} failed: {str(e)}")
+                success = False
+
+        return success
+
+    def tap(self, x: int, y: int) -> bool:
+        """Tap at coordinates (x, y) on all devices"""
+        return self._broadcast(_TAP(x, y))
+
+    def swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: int = 300) -> bool:
+        """Swipe on all devices"""
+        return self._broadcast(_SWIPE(start_x, start_y, end_x, end_y, duration))
+
+    def input_text(self, text: str) -> bool:
+        """Input text on all devices"""
+        return self._broadcast(_TEXT(text.replace(' ', '%s')))
+
+    def press_key(self, key: str) -> bool:
+        """Press hardware key on all devices"""
+        key_code = _KEY_CODES.get(key)
+        if key_code is None:
+            self.logger.error(f"Unknown key: {key}")
+            return False
+        return self._broadcast(_KEY(key_code))
+
+    def long_press(self, x: int, y: int, duration: int = 1000) -> bool:
+        """Long press on all devices"""
+        return self._broadcast(_SWIPE(x, y, x, y, duration))
+
+    def execute_batch(self, actions: list) -> bool:
+        """Execute an action sequence on all devices in one invocation each"""
+        try:
+            command = '; '.join(_action_to_command(a) for a in actions)
+        except ValueError as e:
+            self.logger.error(str(e))
+            return False
+        return self._broadcast(command)
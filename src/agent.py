@@ -1,7 +1,10 @@
 """Main agent orchestrator implementing the perception-reasoning-action cycle."""
 
 import time
+import hashlib
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 
@@ -16,14 +19,17 @@ class AgentState:
     """Represents the current state of the agent."""
     task_description: str
     current_screen: Optional[Dict] = None
-    action_history: List[Dict] = None
+    action_history: Optional[deque] = None
     step_count: int = 0
     max_steps: int = 50
+    history_window: int = 8
     task_completed: bool = False
-    
+
     def __post_init__(self):
         if self.action_history is None:
-            self.action_history = []
+            # Bounded deque: old records are evicted automatically, so
+            # prompt size stays bounded with no per-step list trimming
+            self.action_history = deque(maxlen=self.history_window)
 
 
 class GUIAutomationAgent:
@@ -38,11 +44,21 @@ class GUIAutomationAgent:
         self.logger = setup_logger(__name__, config.get('log_level', 'INFO'))
         self.config = config
         
-        # Initialize core modules
-        self.perception = PerceptionModule(config)
-        self.action_executor = ActionExecutor(config)
-        self.inference = GemmaInference(config)
-        
+        # Initialize core modules concurrently; model weight loading
+        # dominates, so cold start shrinks from the sum of the init
+        # times to roughly the slowest one
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            perception_future = pool.submit(PerceptionModule, config)
+            executor_future = pool.submit(ActionExecutor, config)
+            inference_future = pool.submit(GemmaInference, config)
+
+            self.perception = perception_future.result()
+            self.action_executor = executor_future.result()
+            self.inference = inference_future.result()
+
+        # Background worker for prefetching screen captures
+        self._capture_pool = ThreadPoolExecutor(max_workers=1)
+
         self.logger.info("Agent initialized successfully")
     
     def execute_task(self, task_description: str, max_steps: int = 50) -> bool:
@@ -57,52 +73,113 @@ class GUIAutomationAgent:
         """
         state = AgentState(
             task_description=task_description,
-            max_steps=max_steps
+            max_steps=max_steps,
+            history_window=self.config.get('agent', {}).get('history_window', 8)
         )
         
         self.logger.info(f"Starting task: {task_description}")
-        
+
+        capture_future = None
+        last_screen_hash = None
+        last_action_failed = False
+
         while not state.task_completed and state.step_count < state.max_steps:
             try:
-                # Perception: Observe current screen state
-                screen_state = self.perception.capture_screen_state()
+                # Perception: Observe current screen state, using the
+                # prefetched capture from the previous step when available
+                if capture_future is not None:
+                    screen_state = capture_future.result()
+                    capture_future = None
+                else:
+                    screen_state = self.perception.capture_screen_state()
                 state.current_screen = screen_state
-                
-                self.logger.info(f"Step {state.step_count + 1}: Analyzing screen")
-                
-                # Reasoning: Determine next action using Gemma model
-                action = self.inference.decide_next_action(
-                    screen_state=screen_state,
-                    task_description=task_description,
-                    action_history=state.action_history
-                )
-                
-                self.logger.info(f"Planned action: {action['type']}")
-                
-                # Check if task is complete
-                if action['type'] == 'task_complete':
-                    state.task_completed = True
-                    self.logger.info("Task completed successfully!")
-                    break
-                
-                # Action: Execute the decided action
-                success = self.action_executor.execute(action)
-                
+
+                screen_hash = hashlib.blake2b(
+                    screen_state['screenshot'].tobytes(), digest_size=8
+                ).digest()
+
+                if last_action_failed and screen_hash == last_screen_hash:
+                    # The UI did not change after a failed action, so the
+                    # model would see the same input again. Skip the
+                    # inference round-trip and try a cheap BACK recovery.
+                    self.logger.info(
+                        "Screen unchanged after failed action, trying BACK"
+                    )
+                    action = {
+                        'type': 'key_event',
+                        'key': 'BACK',
+                        'description': 'Recovery: screen unchanged after failure'
+                    }
+                    success = self.action_executor.execute(action)
+                else:
+                    last_screen_hash = screen_hash
+
+                    self.logger.info(f"Step {state.step_count + 1}: Analyzing screen")
+
+                    # Reasoning: Determine next action using Gemma model
+                    action = self.inference.decide_next_action(
+                        screen_state=screen_state,
+                        task_description=task_description,
+                        action_history=state.action_history
+                    )
+
+                    # Action: Execute the decided action (compound plans are
+                    # batched into a single ADB invocation)
+                    if isinstance(action, list):
+                        # A task_complete sub-action ends the plan: run
+                        # only the actions before it, then finish
+                        complete_idx = next(
+                            (i for i, sub in enumerate(action)
+                             if sub['type'] == 'task_complete'),
+                            None
+                        )
+                        if complete_idx is not None:
+                            state.task_completed = True
+                            action = action[:complete_idx]
+                            self.logger.info("Task completed successfully!")
+
+                        if action:
+                            self.logger.info(f"Planned batch of {len(action)} actions")
+                            success = self.action_executor.execute_batch(action)
+                        else:
+                            success = True
+                    else:
+                        self.logger.info(f"Planned action: {action['type']}")
+
+                        # Check if task is complete
+                        if action['type'] == 'task_complete':
+                            state.task_completed = True
+                            self.logger.info("Task completed successfully!")
+                            break
+
+                        success = self.action_executor.execute(action)
+
                 if not success:
                     self.logger.warning(f"Action failed: {action}")
+                last_action_failed = not success
                 
-                # Update state
-                state.action_history.append({
-                    'step': state.step_count,
-                    'action': action,
-                    'success': success,
-                    'timestamp': time.time()
-                })
-                
+                # Update state, recording compound plans one sub-action
+                # at a time so history consumers always see flat dicts
+                for sub_action in (action if isinstance(action, list) else [action]):
+                    state.action_history.append({
+                        'step': state.step_count,
+                        'action': sub_action,
+                        'success': success,
+                        'timestamp': time.time()
+                    })
+
                 state.step_count += 1
-                
-                # Wait for UI to update
-                time.sleep(self.config.get('step_delay', 1.5))
+
+                if state.task_completed:
+                    break
+
+                # Prefetch the next observation on the worker: it waits
+                # for the UI to settle there before capturing, so the
+                # overlap never hands the model a pre-settle screen
+                capture_future = self._capture_pool.submit(
+                    self._settle_and_capture,
+                    int(self.config.get('step_delay', 1.5) * 1000)
+                )
                 
             except Exception as e:
                 self.logger.error(f"Error at step {state.step_count}: {str(e)}")
@@ -114,8 +191,25 @@ class GUIAutomationAgent:
         
         return state.task_completed
     
+    def _settle_and_capture(self, max_ms: int) -> Dict:
+        """Wait for the UI to settle, then capture the screen state.
+
+        Runs on the capture worker, so the settle wait and both capture
+        round-trips overlap with the main loop's bookkeeping while the
+        returned observation still reflects the settled screen.
+
+        Args:
+            max_ms: Maximum settle wait in milliseconds
+
+        Returns:
+            Captured screen state dictionary
+        """
+        self.perception.wait_until_idle(max_ms=max_ms)
+        return self.perception.capture_screen_state()
+
     def cleanup(self):
         """Cleanup resources."""
+        self._capture_pool.shutdown(wait=False)
         self.perception.cleanup()
         self.action_executor.cleanup()
         self.inference.cleanup()
@@ -1,16 +1,127 @@
 """Inference module using Gemma 3 models for action planning."""
 
+import functools
+import itertools
 import json
-import re
 from typing import Dict, List, Optional
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
 from PIL import Image
 import numpy as np
 
 from .utils import setup_logger
 
 
+def _attn_implementation(device: str) -> str:
+    """Pick the fastest available fused attention backend.
+
+    Args:
+        device: Target device ('cuda' or 'cpu')
+
+    Returns:
+        Attention implementation name for from_pretrained
+    """
+    if device == 'cuda':
+        try:
+            import flash_attn  # noqa: F401
+            return 'flash_attention_2'
+        except ImportError:
+            pass
+    return 'sdpa'
+
+
+@functools.lru_cache(maxsize=4)
+def _load_tokenizer(model_name: str):
+    """Load a tokenizer, caching it per model name.
+
+    Parsing the vocab and merges takes hundreds of milliseconds, so
+    repeated constructions (or GemmaInference and ModelHandler sharing
+    one model) reuse a single tokenizer instance.
+
+    Args:
+        model_name: Hugging Face model identifier
+
+    Returns:
+        Tokenizer instance
+    """
+    return AutoTokenizer.from_pretrained(
+        model_name,
+        use_fast=True,
+        trust_remote_code=True
+    )
+
+
+def _find_json(text: str) -> Optional[str]:
+    """Extract the first balanced {...} block from text.
+
+    A single forward scan tracking brace depth: linear in the response
+    length, and unlike a regex it handles nested objects correctly.
+
+    Args:
+        text: Raw model response
+
+    Returns:
+        The first balanced JSON object substring, or None
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+
+    depth = 0
+    for i in range(start, len(text)):
+        c = text[i]
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+
+    return None
+
+
+class JsonBraceStop(StoppingCriteria):
+    """Stops generation the moment a balanced JSON object has been emitted.
+
+    The action responses are short JSON objects, so decoding is halted
+    as soon as the generated tail contains a balanced {...} block. Only
+    the tokens produced since the previous check are detokenized, and
+    brace depth is carried as running state, so the check is cheap
+    enough to run every step — generation stops within one token of the
+    closing brace instead of running to max_new_tokens.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self._consumed = prompt_length
+        self._depth = 0
+        self._opened = False
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        new_text = self.tokenizer.decode(
+            input_ids[0, self._consumed:],
+            skip_special_tokens=True
+        )
+        self._consumed = input_ids.shape[1]
+
+        for c in new_text:
+            if c == '{':
+                self._depth += 1
+                self._opened = True
+            elif c == '}':
+                self._depth -= 1
+            if self._opened and self._depth <= 0:
+                return True
+
+        return False
+
+
 class GemmaInference:
     """Handles inference using Gemma 3 models for GUI automation."""
     
@@ -28,25 +139,138 @@ class GemmaInference:
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
         self.logger.info(f"Loading model: {self.model_name} on {self.device}")
-        
-        # Load tokenizer and model
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.model_name,
-            trust_remote_code=True
-        )
-        
+
+        # The instruction block never changes between steps. The
+        # transformers path tokenizes it once below; the vLLM path
+        # relies on prefix caching so its prefill is free after the
+        # first call.
+        self._prompt_prefix = """You are an Android GUI automation agent. Your task is to determine the next action to accomplish the user's goal.
+
+Instructions:
+1. Analyze the available UI elements
+2. Consider the task goal and action history
+3. Decide the next action to take
+4. Respond with a JSON object containing the action
+
+Action types:
+- tap: Click an element (requires: element_id or x, y coordinates)
+- text_input: Enter text (requires: text)
+- swipe: Swipe gesture (requires: x1, y1, x2, y2)
+- key_event: Press hardware key (requires: key like HOME, BACK, ENTER)
+- scroll_down/scroll_up: Scroll (requires: x, y)
+- task_complete: Task is finished
+- wait: Wait briefly (requires: duration in seconds)
+
+Example response:
+{
+  "action_type": "tap",
+  "element_id": 5,
+  "reasoning": "Clicking the search button to proceed with the task"
+}
+
+"""
+
+        # Optional vLLM backend: PagedAttention plus prefix caching
+        # covers what the static-cache/compile/prefix machinery below
+        # hand-rolls on top of transformers
+        self._vllm = None
+        if config.get('backend') == 'vllm':
+            try:
+                from vllm import LLM, SamplingParams
+                self._vllm = LLM(
+                    model=self.model_name,
+                    dtype='bfloat16',
+                    max_model_len=2048,
+                    enable_prefix_caching=True
+                )
+                self._SamplingParams = SamplingParams
+                self.logger.info("Model loaded successfully (vLLM backend)")
+                return
+            except ImportError:
+                self.logger.warning(
+                    "backend=vllm but vllm is not installed, using transformers"
+                )
+
+        # Load tokenizer (cached per model name) and model
+        self.tokenizer = _load_tokenizer(self.model_name)
+
+        # bf16 has fp16's bandwidth with fp32's exponent range, so it
+        # avoids overflow-induced stalls on Ampere+ GPUs
+        if self.device == 'cuda':
+            dtype = (torch.bfloat16 if torch.cuda.is_bf16_supported()
+                     else torch.float16)
+        else:
+            dtype = torch.float32
+
+        # device_map already places the weights, including the CPU case
         self.model = AutoModelForCausalLM.from_pretrained(
             self.model_name,
-            torch_dtype=torch.float16 if self.device == 'cuda' else torch.float32,
-            device_map='auto' if self.device == 'cuda' else None,
+            torch_dtype=dtype,
+            device_map='auto' if self.device == 'cuda' else self.device,
+            attn_implementation=_attn_implementation(self.device),
             trust_remote_code=True
         )
-        
-        if self.device == 'cpu':
-            self.model = self.model.to(self.device)
-        
+
         self.model.eval()
-        
+
+        # Static KV cache keeps decode buffers preallocated across the
+        # repeated generate() calls of the agent loop instead of
+        # growing a fresh dynamic cache every step
+        if config.get('static_kv_cache', True):
+            try:
+                self.model.generation_config.cache_implementation = 'static'
+            except AttributeError:
+                self.logger.warning("Static KV cache not supported, using default")
+
+        # Optional quantized KV cache: at long contexts the cache can
+        # outweigh the 2B model weights, and decode attention is
+        # bandwidth-bound, so fewer KV bytes read per step is a direct
+        # latency win. Falls back to the default cache when the quanto
+        # backend is missing.
+        self._cache_kwargs = {}
+        if config.get('kv_quant', False):
+            try:
+                import optimum.quanto  # noqa: F401
+                self._cache_kwargs = {
+                    'cache_implementation': 'quantized',
+                    'cache_config': {'backend': 'quanto', 'nbits': 4}
+                }
+            except ImportError:
+                self.logger.warning(
+                    "kv_quant enabled but quanto is not installed, "
+                    "using default KV cache"
+                )
+
+        # Tokenize the static prefix once; per-step prompts only supply
+        # the dynamic suffix
+        self._prompt_prefix_ids = self.tokenizer(
+            self._prompt_prefix, return_tensors='pt'
+        ).input_ids.to(self.device)
+
+        # Compile the decoding forward pass on GPU; with the static
+        # cache's stable shapes this fuses attention/MLP kernels
+        if self.device == 'cuda' and config.get('compile', True):
+            try:
+                self.model.forward = torch.compile(
+                    self.model.forward,
+                    mode='reduce-overhead',
+                    fullgraph=True,
+                    dynamic=False
+                )
+
+                # Tiny warmup generation absorbs the compile latency
+                # before the agent loop starts
+                warmup = self.tokenizer('warmup', return_tensors='pt').to(self.device)
+                with torch.no_grad():
+                    self.model.generate(
+                        **warmup,
+                        max_new_tokens=4,
+                        do_sample=False,
+                        pad_token_id=self.tokenizer.eos_token_id
+                    )
+            except Exception as e:
+                self.logger.warning(f"torch.compile failed, using eager mode: {e}")
+
         self.logger.info("Model loaded successfully")
     
     def decide_next_action(
@@ -72,10 +296,23 @@ class GemmaInference:
         
         # Generate response from model
         response = self._generate_response(prompt)
-        
+
         # Parse response into action
         action = self._parse_action_from_response(response, screen_state)
-        
+
+        if action is None:
+            # Retry with one sampled batch: num_return_sequences shares
+            # the prompt prefill, so four candidates cost little more
+            # than the single greedy attempt that just failed
+            self.logger.warning("Unparseable response, retrying with a batch of 4")
+            for candidate in self._generate_batch(prompt, n=4):
+                action = self._parse_action_from_response(candidate, screen_state)
+                if action is not None:
+                    break
+
+        if action is None:
+            action = {'type': 'wait', 'duration': 1}
+
         return action
     
     def _create_action_prompt(
@@ -84,21 +321,42 @@ class GemmaInference:
         task_description: str,
         action_history: List[Dict]
     ) -> str:
-        """Create a prompt for action planning.
-        
+        """Create the dynamic portion of the action prompt.
+
+        The static instruction block lives in self._prompt_prefix and
+        is prepended (pre-tokenized) during generation.
+
         Args:
             screen_state: Current screen state
             task_description: Task description
             action_history: Previous actions
-            
+
         Returns:
-            Formatted prompt string
+            Formatted prompt suffix string
         """
         ui_elements = screen_state['ui_hierarchy']['elements']
-        
+        arrays = screen_state['ui_hierarchy'].get('arrays')
+
+        # Pick the 20 most salient elements instead of the first 20 in
+        # dump order: clickable and labelled elements carry far more
+        # signal per prompt token than layout chrome. argpartition keeps
+        # the selection O(N) without a full sort.
+        if arrays is not None and len(ui_elements) > 20:
+            bounds = arrays['bounds']
+            areas = ((bounds[:, 2] - bounds[:, 0]) *
+                     (bounds[:, 3] - bounds[:, 1]))
+            score = (arrays['clickable'].astype(np.int8) * 2 +
+                     (arrays['text_lengths'] > 0) +
+                     areas / max(int(areas.max()), 1))
+            top = np.argpartition(-score, 20)[:20]
+            top.sort()  # keep on-screen order in the prompt
+            selected = [(int(i), ui_elements[i]) for i in top]
+        else:
+            selected = list(enumerate(ui_elements[:20]))
+
         # Create element list with IDs
         elements_text = "Available UI Elements:\n"
-        for idx, elem in enumerate(ui_elements[:20]):  # Limit to 20 elements
+        for idx, elem in selected:
             text = elem.get('text', '')
             desc = elem.get('content_desc', '')
             elem_type = elem.get('class', '').split('.')[-1]
@@ -107,49 +365,43 @@ class GemmaInference:
             label = text or desc or elem_type
             elements_text += f"  {idx}: {label} ({elem_type}) {clickable} at ({elem['center']['x']}, {elem['center']['y']})\n"
         
-        # Format action history
+        # Format action history (islice works for deque and list alike)
         history_text = ""
         if action_history:
-            recent_actions = action_history[-3:]  # Last 3 actions
+            recent_actions = itertools.islice(
+                action_history, max(0, len(action_history) - 3), None
+            )  # Last 3 actions
             history_text = "\nRecent Actions:\n"
             for action_record in recent_actions:
                 action = action_record['action']
                 history_text += f"  - {action['type']}: {action.get('description', 'N/A')}\n"
         
-        prompt = f"""You are an Android GUI automation agent. Your task is to determine the next action to accomplish the user's goal.
-
-Task: {task_description}
+        prompt = f"""Task: {task_description}
 
 {elements_text}
 {history_text}
 
-Instructions:
-1. Analyze the available UI elements
-2. Consider the task goal and action history
-3. Decide the next action to take
-4. Respond with a JSON object containing the action
-
-Action types:
-- tap: Click an element (requires: element_id or x, y coordinates)
-- text_input: Enter text (requires: text)
-- swipe: Swipe gesture (requires: x1, y1, x2, y2)
-- key_event: Press hardware key (requires: key like HOME, BACK, ENTER)
-- scroll_down/scroll_up: Scroll (requires: x, y)
-- task_complete: Task is finished
-- wait: Wait briefly (requires: duration in seconds)
-
-Example response:
-{{
-  "action_type": "tap",
-  "element_id": 5,
-  "reasoning": "Clicking the search button to proceed with the task"
-}}
-
 Your response (JSON only):"""
-        
+
         return prompt
     
-    def _generate_response(self, prompt: str, max_length: int = 512) -> str:
+    def _to_device(self, ids: torch.Tensor) -> torch.Tensor:
+        """Move token ids to the model device.
+
+        On CUDA the host tensor is pinned so the copy is asynchronous
+        and overlaps with launch setup instead of stalling the step.
+
+        Args:
+            ids: Token id tensor on the host
+
+        Returns:
+            Tensor on the model device
+        """
+        if self.device == 'cuda':
+            return ids.pin_memory().to(self.device, non_blocking=True)
+        return ids
+
+    def _generate_response(self, prompt: str, max_length: int = 96) -> str:
         """Generate response from Gemma model.
         
         Args:
@@ -159,135 +411,245 @@ Your response (JSON only):"""
         Returns:
             Generated text
         """
+        if self._vllm is not None:
+            try:
+                outputs = self._vllm.generate(
+                    [self._prompt_prefix + prompt],
+                    self._SamplingParams(max_tokens=max_length, temperature=0)
+                )
+                return outputs[0].outputs[0].text.strip()
+            except Exception as e:
+                self.logger.error(f"Generation failed: {e}")
+                return '{}'
+
         try:
-            # Tokenize input
-            inputs = self.tokenizer(
+            # Tokenize only the dynamic suffix and splice it onto the
+            # pre-tokenized instruction prefix
+            suffix_ids = self._to_device(self.tokenizer(
                 prompt,
                 return_tensors='pt',
                 truncation=True,
-                max_length=2048
-            ).to(self.device)
-            
+                max_length=2048,
+                add_special_tokens=False
+            ).input_ids)
+
+            input_ids = torch.cat([self._prompt_prefix_ids, suffix_ids], dim=1)
+            prompt_length = input_ids.shape[1]
+
             # Generate
             with torch.no_grad():
+                # Greedy decoding: the output is structured JSON with few
+                # viable tokens, so sampling only adds per-token softmax
+                # and multinomial overhead and nondeterminism
                 outputs = self.model.generate(
-                    **inputs,
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
                     max_new_tokens=max_length,
-                    temperature=0.7,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id
+                    do_sample=False,
+                    num_beams=1,
+                    use_cache=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([
+                        JsonBraceStop(self.tokenizer, prompt_length)
+                    ]),
+                    **self._cache_kwargs
                 )
-            
+
             # Decode response
             response = self.tokenizer.decode(
-                outputs[0][inputs['input_ids'].shape[1]:],
+                outputs[0][prompt_length:],
                 skip_special_tokens=True
             )
-            
+
             return response.strip()
             
         except Exception as e:
             self.logger.error(f"Generation failed: {e}")
             return '{}'
-    
+
+    def _generate_batch(
+        self, prompt: str, n: int = 4, max_length: int = 96
+    ) -> List[str]:
+        """Generate several candidate responses in one batched call.
+
+        num_return_sequences amortizes the prompt prefill across all
+        candidates, so n hypotheses cost little more than one. Sampling
+        is enabled so the candidates actually differ.
+
+        Args:
+            prompt: Input prompt
+            n: Number of candidate responses
+            max_length: Maximum response length
+
+        Returns:
+            List of generated candidate texts
+        """
+        if self._vllm is not None:
+            try:
+                outputs = self._vllm.generate(
+                    [self._prompt_prefix + prompt],
+                    self._SamplingParams(
+                        max_tokens=max_length, temperature=0.7, n=n
+                    )
+                )
+                return [o.text.strip() for o in outputs[0].outputs]
+            except Exception as e:
+                self.logger.error(f"Batch generation failed: {e}")
+                return []
+
+        try:
+            suffix_ids = self._to_device(self.tokenizer(
+                prompt,
+                return_tensors='pt',
+                truncation=True,
+                max_length=2048,
+                add_special_tokens=False
+            ).input_ids)
+
+            input_ids = torch.cat([self._prompt_prefix_ids, suffix_ids], dim=1)
+            prompt_length = input_ids.shape[1]
+
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_length,
+                    do_sample=True,
+                    temperature=0.7,
+                    num_return_sequences=n,
+                    use_cache=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    **self._cache_kwargs
+                )
+
+            return [
+                self.tokenizer.decode(
+                    row[prompt_length:], skip_special_tokens=True
+                ).strip()
+                for row in outputs
+            ]
+
+        except Exception as e:
+            self.logger.error(f"Batch generation failed: {e}")
+            return []
+
     def _parse_action_from_response(
         self,
         response: str,
         screen_state: Dict
-    ) -> Dict:
+    ) -> Optional[Dict]:
         """Parse action from model response.
-        
+
         Args:
             response: Model's response text
             screen_state: Current screen state
-            
+
         Returns:
-            Action dictionary
+            Action dictionary, or None when no valid JSON was found
         """
         try:
             # Extract JSON from response
-            json_match = re.search(r'\{[^{}]*\}', response, re.DOTALL)
-            if not json_match:
+            json_str = _find_json(response)
+            if json_str is None:
                 self.logger.warning("No JSON found in response")
-                return {'type': 'wait', 'duration': 1}
-            
-            json_str = json_match.group(0)
+                return None
+
             action_data = json.loads(json_str)
-            
-            action_type = action_data.get('action_type', 'wait')
-            
-            # Build action based on type
-            if action_type == 'tap':
-                element_id = action_data.get('element_id')
-                if element_id is not None:
-                    elements = screen_state['ui_hierarchy']['elements']
-                    if 0 <= element_id < len(elements):
-                        elem = elements[element_id]
-                        return {
-                            'type': 'tap',
-                            'x': elem['center']['x'],
-                            'y': elem['center']['y'],
-                            'description': action_data.get('reasoning', '')
-                        }
-                
-                # Fallback to coordinates
-                return {
-                    'type': 'tap',
-                    'x': action_data.get('x', 100),
-                    'y': action_data.get('y', 100),
-                    'description': action_data.get('reasoning', '')
-                }
-            
-            elif action_type == 'text_input':
-                return {
-                    'type': 'text_input',
-                    'text': action_data.get('text', ''),
-                    'description': action_data.get('reasoning', '')
-                }
-            
-            elif action_type == 'swipe':
-                return {
-                    'type': 'swipe',
-                    'x1': action_data.get('x1', 500),
-                    'y1': action_data.get('y1', 1000),
-                    'x2': action_data.get('x2', 500),
-                    'y2': action_data.get('y2', 300),
-                    'description': action_data.get('reasoning', '')
-                }
-            
-            elif action_type in ['key_event', 'press_key']:
-                return {
-                    'type': 'key_event',
-                    'key': action_data.get('key', 'BACK'),
-                    'description': action_data.get('reasoning', '')
-                }
-            
-            elif action_type == 'task_complete':
-                return {
-                    'type': 'task_complete',
-                    'description': action_data.get('reasoning', 'Task completed')
-                }
-            
-            else:
-                return {
-                    'type': 'wait',
-                    'duration': 1,
-                    'description': 'Unknown action, waiting'
-                }
-            
+
+            # Compound plans: a list of sub-actions executed as one batch
+            if isinstance(action_data.get('actions'), list):
+                return [
+                    self._build_action(sub_action, screen_state)
+                    for sub_action in action_data['actions']
+                ]
+
+            return self._build_action(action_data, screen_state)
+
         except json.JSONDecodeError as e:
             self.logger.error(f"Failed to parse JSON: {e}")
-            return {'type': 'wait', 'duration': 1}
+            return None
         except Exception as e:
             self.logger.error(f"Error parsing action: {e}")
-            return {'type': 'wait', 'duration': 1}
-    
+            return None
+
+    def _build_action(self, action_data: Dict, screen_state: Dict) -> Dict:
+        """Build an executable action from parsed model output.
+
+        Args:
+            action_data: Parsed JSON action data
+            screen_state: Current screen state
+
+        Returns:
+            Action dictionary
+        """
+        action_type = action_data.get('action_type', 'wait')
+
+        # Build action based on type
+        if action_type == 'tap':
+            element_id = action_data.get('element_id')
+            if element_id is not None:
+                elements = screen_state['ui_hierarchy']['elements']
+                if 0 <= element_id < len(elements):
+                    elem = elements[element_id]
+                    return {
+                        'type': 'tap',
+                        'x': elem['center']['x'],
+                        'y': elem['center']['y'],
+                        'description': action_data.get('reasoning', '')
+                    }
+
+            # Fallback to coordinates
+            return {
+                'type': 'tap',
+                'x': action_data.get('x', 100),
+                'y': action_data.get('y', 100),
+                'description': action_data.get('reasoning', '')
+            }
+
+        elif action_type == 'text_input':
+            return {
+                'type': 'text_input',
+                'text': action_data.get('text', ''),
+                'description': action_data.get('reasoning', '')
+            }
+
+        elif action_type == 'swipe':
+            return {
+                'type': 'swipe',
+                'x1': action_data.get('x1', 500),
+                'y1': action_data.get('y1', 1000),
+                'x2': action_data.get('x2', 500),
+                'y2': action_data.get('y2', 300),
+                'description': action_data.get('reasoning', '')
+            }
+
+        elif action_type in ['key_event', 'press_key']:
+            return {
+                'type': 'key_event',
+                'key': action_data.get('key', 'BACK'),
+                'description': action_data.get('reasoning', '')
+            }
+
+        elif action_type == 'task_complete':
+            return {
+                'type': 'task_complete',
+                'description': action_data.get('reasoning', 'Task completed')
+            }
+
+        else:
+            return {
+                'type': 'wait',
+                'duration': 1,
+                'description': 'Unknown action, waiting'
+            }
+
     def cleanup(self):
         """Cleanup resources."""
         if hasattr(self, 'model'):
             del self.model
         if hasattr(self, 'tokenizer'):
             del self.tokenizer
+        if getattr(self, '_vllm', None) is not None:
+            del self._vllm
         torch.cuda.empty_cache()
         self.logger.info("Inference module cleanup completed")
@@ -7,10 +7,21 @@ import io
 import base64
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoModelForCausalLM,
+    BitsAndBytesConfig,
+    StoppingCriteriaList,
+)
 from PIL import Image
 import numpy as np
 
+from .inference import (
+    JsonBraceStop,
+    _attn_implementation,
+    _find_json,
+    _load_tokenizer,
+)
+
 
 class ModelHandler:
     """Handles Gemma 3 model inference for action planning"""
@@ -22,31 +33,105 @@ class ModelHandler:
         model_config = config['model']
         self.device = torch.device(model_config['device'])
         
-        # Load tokenizer and model
+        # Load tokenizer (cached per model name) and model
         self.logger.info(f"Loading model: {model_config['name']}")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_config['name'])
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_config['name'],
-            torch_dtype=torch.float16 if model_config['device'] == 'cuda' else torch.float32,
-            device_map=model_config['device']
-        )
-        
-        # Apply quantization if specified
-        if model_config.get('quantization') == 'int8':
-            self._quantize_model_int8()
-        
+        self.tokenizer = _load_tokenizer(model_config['name'])
+        self.model = self._load_model(model_config)
+
         self.model.eval()
+
+        # Compile the decoding forward pass on GPU for fused kernels;
+        # CPU mode regresses under compile so it stays eager
+        if model_config['device'] == 'cuda' and model_config.get('compile', True):
+            try:
+                self.model.forward = torch.compile(
+                    self.model.forward,
+                    mode='reduce-overhead',
+                    fullgraph=True,
+                    dynamic=False
+                )
+
+                warmup = self.tokenizer('warmup', return_tensors='pt').to(self.device)
+                with torch.no_grad():
+                    self.model.generate(
+                        **warmup,
+                        max_new_tokens=4,
+                        do_sample=False,
+                        pad_token_id=self.tokenizer.eos_token_id
+                    )
+            except Exception as e:
+                self.logger.warning(f"torch.compile failed, using eager mode: {str(e)}")
+
+        # The instruction preamble never changes, so build and tokenize
+        # it once; per-step requests only tokenize their dynamic suffix
+        self._system_prompt = self._build_system_prompt()
+        self._system_prompt_ids = self.tokenizer(
+            self._system_prompt, return_tensors="pt"
+        ).input_ids.to(self.device)
+
         self.logger.info("Model loaded successfully")
+
+    def _build_system_prompt(self) -> str:
+        """Build the static instruction preamble shared by every request"""
+        return (
+            "You are an Android GUI automation agent. Analyze the current "
+            "screen state and decide the next action to accomplish the "
+            "user's task.\n"
+            "Respond with a JSON object of the form:\n"
+            '{"reasoning": "...", "action": {"type": "..."}, '
+            '"task_complete": false}\n\n'
+        )
     
-    def _quantize_model_int8(self):
-        """Apply INT8 quantization for smaller memory footprint"""
-        try:
-            self.model = torch.quantization.quantize_dynamic(
-                self.model, {torch.nn.Linear}, dtype=torch.qint8
+    def _load_model(self, model_config: Dict):
+        """Load the causal LM, quantized at load time when requested
+
+        Quantization uses bitsandbytes (LLM.int8() / NF4), which keeps
+        CUDA kernel paths intact, unlike dynamic post-load quantization.
+        Weight placement is handled by the loader, so no manual .to()
+        move happens for quantized models.
+        """
+        quantization = model_config.get('quantization')
+
+        quantization_config = None
+        if quantization == 'int8':
+            quantization_config = BitsAndBytesConfig(
+                load_in_8bit=True,
+                llm_int8_threshold=6.0
             )
-            self.logger.info("Model quantized to INT8")
-        except Exception as e:
-            self.logger.warning(f"Quantization failed: {str(e)}")
+        elif quantization == 'int4':
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type='nf4',
+                bnb_4bit_compute_dtype=torch.bfloat16
+            )
+
+        if quantization_config is not None:
+            try:
+                return AutoModelForCausalLM.from_pretrained(
+                    model_config['name'],
+                    quantization_config=quantization_config,
+                    device_map=model_config['device'],
+                    attn_implementation=_attn_implementation(model_config['device'])
+                )
+            except Exception as e:
+                self.logger.warning(
+                    f"Quantized load failed ({str(e)}), loading unquantized"
+                )
+
+        # bf16 matches fp16 bandwidth but keeps fp32's exponent range,
+        # avoiding overflow stalls on Ampere+ GPUs
+        if model_config['device'] == 'cuda':
+            dtype = (torch.bfloat16 if torch.cuda.is_bf16_supported()
+                     else torch.float16)
+        else:
+            dtype = torch.float32
+
+        return AutoModelForCausalLM.from_pretrained(
+            model_config['name'],
+            torch_dtype=dtype,
+            device_map=model_config['device'],
+            attn_implementation=_attn_implementation(model_config['device'])
+        )
     
     def get_next_action(self, screen_data: Dict, conversation_history: List[Dict]) -> Dict:
         """Generate next action based on screen state"""
@@ -54,19 +139,30 @@ class ModelHandler:
             # Build prompt from screen data
             prompt = self._build_prompt(screen_data, conversation_history)
             
-            # Generate response
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-            
+            # Generate response, reusing the pre-tokenized system prompt
+            suffix = self.tokenizer(
+                prompt, return_tensors="pt", add_special_tokens=False
+            ).input_ids.to(self.device)
+            input_ids = torch.cat([self._system_prompt_ids, suffix], dim=1)
+
             with torch.no_grad():
                 outputs = self.model.generate(
-                    **inputs,
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
                     max_new_tokens=self.config['model']['max_tokens'],
                     temperature=self.config['model']['temperature'],
                     do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([
+                        JsonBraceStop(self.tokenizer, input_ids.shape[1])
+                    ])
                 )
             
-            response_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # Decode only the generated tail: the system prompt embeds a
+            # JSON example that _find_json would otherwise match first
+            response_text = self.tokenizer.decode(
+                outputs[0][input_ids.shape[1]:], skip_special_tokens=True
+            )
             
             # Extract JSON response from model output
             action_dict = self._parse_model_response(response_text)
@@ -114,11 +210,9 @@ Provide the next action as JSON:
         """Parse JSON from model response"""
         try:
             # Try to find JSON in response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
+            json_str = _find_json(response)
+
+            if json_str is not None:
                 action_dict = json.loads(json_str)
                 return action_dict
             else:
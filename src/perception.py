@@ -1,17 +1,27 @@
 """Perception module for capturing and processing screen state."""
 
 import os
+import re
 import time
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from pathlib import Path
-import xml.etree.ElementTree as ET
+from lxml import etree as LET
+from ppadb.client import Client as AdbClient
 from PIL import Image
+import numpy as np
 import io
 
 from .utils import setup_logger
 
 
+# Bounds strings look like '[x1,y1][x2,y2]'; compiled once since the
+# parse runs for every node of every UI dump
+_BOUNDS_RE = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+
+
 class PerceptionModule:
     """Handles screen capture and UI hierarchy extraction."""
     
@@ -26,10 +36,77 @@ class PerceptionModule:
         self.device_id = config.get('device_id')
         self.screenshot_dir = Path(config.get('screenshot_dir', 'screenshots'))
         self.screenshot_dir.mkdir(exist_ok=True)
-        
+
+        # Stream mode: background thread keeping the latest frame fresh
+        self._stream_thread: Optional[threading.Thread] = None
+        self._stream_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._latest_frame: Optional[Image.Image] = None
+
+        # Screen dimensions never change mid-task; queried once on
+        # first use via 'wm size'
+        self._screen_size: Optional[tuple] = None
+
+        # Debug screenshot saves happen off-thread so the agent loop
+        # never waits on an image encode
+        self._save_pool = ThreadPoolExecutor(max_workers=1)
+
+        # Pool for running the screenshot and UI-dump round-trips in
+        # parallel inside capture_screen_state
+        self._capture_pool = ThreadPoolExecutor(max_workers=2)
+
+        # Primary transport: ppadb multiplexes every command over one
+        # TCP connection to the adb server, avoiding a ~30-80 ms adb
+        # binary spawn per call. Falls back to subprocess when the
+        # server is unreachable.
+        self._device = self._connect_ppadb()
+
         # Verify ADB connection
-        self._verify_adb_connection()
-    
+        if self._device is None:
+            self._verify_adb_connection()
+
+    def _connect_ppadb(self):
+        """Resolve the device handle on the adb server connection.
+
+        Returns:
+            ppadb Device object, or None if the adb server is unreachable
+        """
+        try:
+            client = AdbClient(host='127.0.0.1', port=5037)
+            devices = client.devices()
+
+            if not devices:
+                return None
+
+            if self.device_id:
+                return next(
+                    (d for d in devices if d.serial == self.device_id), None
+                )
+            return devices[0]
+
+        except Exception as e:
+            self.logger.debug(f"ppadb unavailable: {e}")
+            return None
+
+    def _shell(self, command: str) -> str:
+        """Run a device shell command, preferring the ppadb connection.
+
+        Args:
+            command: Shell command string
+
+        Returns:
+            Command output as text
+        """
+        if self._device is not None:
+            try:
+                return self._device.shell(command)
+            except Exception as e:
+                self.logger.debug(f"ppadb shell failed: {e}, using adb binary")
+                self._device = None
+
+        result = self._run_adb_command(['shell', command])
+        return result.stdout.decode('utf-8', 'replace')
+
     def _verify_adb_connection(self):
         """Verify ADB is installed and device is connected."""
         try:
@@ -70,33 +147,104 @@ class PerceptionModule:
             check=True
         )
     
+    def start_stream(self, interval: float = 0.2):
+        """Start refreshing the latest frame on a background thread.
+
+        While streaming, capture_screenshot returns the most recent
+        cached frame instead of paying an ADB round-trip per call.
+
+        Args:
+            interval: Delay between background captures in seconds
+        """
+        if self._stream_thread is not None and self._stream_thread.is_alive():
+            return
+
+        self._stream_stop.clear()
+        self._stream_thread = threading.Thread(
+            target=self._stream_loop, args=(interval,), daemon=True
+        )
+        self._stream_thread.start()
+        self.logger.info("Screenshot stream started")
+
+    def stop_stream(self):
+        """Stop the background frame stream."""
+        if self._stream_thread is None:
+            return
+
+        self._stream_stop.set()
+        self._stream_thread.join(timeout=2)
+        self._stream_thread = None
+        self.logger.info("Screenshot stream stopped")
+
+    def _stream_loop(self, interval: float):
+        """Background loop refreshing the latest frame."""
+        while not self._stream_stop.is_set():
+            try:
+                frame = self._grab_screenshot()
+                with self._frame_lock:
+                    self._latest_frame = frame
+            except Exception as e:
+                self.logger.debug(f"Stream capture failed: {e}")
+            self._stream_stop.wait(interval)
+
+    def _grab_screenshot(self) -> Image.Image:
+        """Capture a single screenshot over ADB.
+
+        Returns:
+            PIL Image object
+        """
+        if self._device is not None:
+            try:
+                return Image.open(io.BytesIO(self._device.screencap()))
+            except Exception as e:
+                self.logger.debug(f"ppadb screencap failed: {e}, using adb binary")
+                self._device = None
+
+        result = self._run_adb_command(['shell', 'screencap -p'])
+
+        return Image.open(io.BytesIO(result.stdout))
+
     def capture_screenshot(self) -> Image.Image:
         """Capture screenshot from Android device.
-        
+
         Returns:
             PIL Image object
         """
         try:
-            # Capture screenshot
-            result = self._run_adb_command(
-                ['shell', 'screencap', '-p']
-            )
-            
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(result.stdout))
-            
-            # Save screenshot with timestamp
-            timestamp = int(time.time())
-            screenshot_path = self.screenshot_dir / f"screenshot_{timestamp}.png"
-            image.save(screenshot_path)
-            
-            self.logger.debug(f"Screenshot saved: {screenshot_path}")
-            
+            # Use the freshest streamed frame when available, otherwise
+            # fall back to a direct capture
+            image = None
+            if self._stream_thread is not None and self._stream_thread.is_alive():
+                with self._frame_lock:
+                    image = self._latest_frame
+            if image is None:
+                image = self._grab_screenshot()
+
+            # Screenshots are debug artifacts: only save when asked,
+            # and do it on the background worker as a smaller JPEG
+            if self.config.get('save_screenshots', False):
+                timestamp = int(time.time())
+                screenshot_path = self.screenshot_dir / f"screenshot_{timestamp}.jpg"
+                self._save_pool.submit(self._save_screenshot, image, screenshot_path)
+
             return image
-            
+
         except Exception as e:
             self.logger.error(f"Failed to capture screenshot: {e}")
             raise
+
+    def _save_screenshot(self, image: Image.Image, path: Path):
+        """Write a debug screenshot to disk (runs on the save worker).
+
+        Args:
+            image: Screenshot to save
+            path: Destination file path
+        """
+        try:
+            image.convert('RGB').save(path, format='JPEG', quality=80)
+            self.logger.debug(f"Screenshot saved: {path}")
+        except Exception as e:
+            self.logger.debug(f"Failed to save screenshot: {e}")
     
     def extract_ui_hierarchy(self) -> Dict:
         """Extract UI hierarchy using uiautomator.
@@ -105,76 +253,123 @@ class PerceptionModule:
             Dictionary containing parsed UI elements
         """
         try:
-            # Dump UI hierarchy to device
-            self._run_adb_command(
-                ['shell', 'uiautomator', 'dump', '/sdcard/window_dump.xml']
-            )
-            
-            # Pull XML file
-            result = self._run_adb_command(
-                ['shell', 'cat', '/sdcard/window_dump.xml']
-            )
-            
-            xml_content = result.stdout.decode('utf-8')
-            
-            # Parse XML
-            root = ET.fromstring(xml_content)
-            
+            # Stream the dump straight back over one transport instead
+            # of writing to sdcard and reading it back in a second trip
+            if self._device is not None:
+                xml_content = self._shell(
+                    'uiautomator dump /dev/tty'
+                ).encode('utf-8', 'replace')
+            else:
+                result = self._run_adb_command(
+                    ['exec-out', 'uiautomator', 'dump', '/dev/tty']
+                )
+                xml_content = result.stdout
+
+            # Drop the status line uiautomator appends after the XML
+            # ("UI hierchary dumped to: /dev/tty")
+            xml_end = xml_content.rfind(b'>')
+
+            # Parse XML with lxml's C-implemented parser
+            root = LET.fromstring(xml_content[:xml_end + 1])
+
             # Extract UI elements
             ui_elements = self._parse_ui_elements(root)
             
             return {
                 'elements': ui_elements,
                 'element_count': len(ui_elements),
+                'arrays': self._build_arrays(ui_elements),
                 'timestamp': time.time()
             }
-            
+
         except Exception as e:
             self.logger.error(f"Failed to extract UI hierarchy: {e}")
-            return {'elements': [], 'element_count': 0, 'timestamp': time.time()}
+            return {
+                'elements': [],
+                'element_count': 0,
+                'arrays': self._build_arrays([]),
+                'timestamp': time.time()
+            }
     
-    def _parse_ui_elements(self, root: ET.Element, parent_path: str = "") -> List[Dict]:
-        """Recursively parse UI elements from XML.
-        
+    def _parse_ui_elements(self, root) -> List[Dict]:
+        """Parse UI elements from the uiautomator dump in a single pass.
+
+        uiautomator dumps use <node> tags exclusively, so one flat
+        iteration over the tree replaces the recursive walk.
+
         Args:
-            root: XML element
-            parent_path: Path of parent element
-            
+            root: Parsed XML root element
+
         Returns:
             List of UI element dictionaries
         """
         elements = []
-        
-        for idx, child in enumerate(root):
-            element_path = f"{parent_path}/{child.tag}[{idx}]"
-            
-            # Extract bounds
-            bounds_str = child.attrib.get('bounds', '[0,0][0,0]')
-            bounds = self._parse_bounds(bounds_str)
-            
+
+        for node in root.iter('node'):
+            attrib = node.attrib
+
+            bounds = self._parse_bounds(attrib.get('bounds', '[0,0][0,0]'))
+
             element = {
-                'path': element_path,
-                'class': child.attrib.get('class', ''),
-                'text': child.attrib.get('text', ''),
-                'content_desc': child.attrib.get('content-desc', ''),
-                'resource_id': child.attrib.get('resource-id', ''),
-                'clickable': child.attrib.get('clickable', 'false') == 'true',
-                'scrollable': child.attrib.get('scrollable', 'false') == 'true',
-                'enabled': child.attrib.get('enabled', 'true') == 'true',
+                'class': attrib.get('class', ''),
+                'text': attrib.get('text', ''),
+                'content_desc': attrib.get('content-desc', ''),
+                'resource_id': attrib.get('resource-id', ''),
+                'clickable': attrib.get('clickable') == 'true',
+                'scrollable': attrib.get('scrollable') == 'true',
+                'enabled': attrib.get('enabled', 'true') == 'true',
                 'bounds': bounds,
                 'center': self._calculate_center(bounds)
             }
-            
+
             # Only include interactive or informative elements
-            if (element['clickable'] or element['scrollable'] or 
+            if (element['clickable'] or element['scrollable'] or
                 element['text'] or element['content_desc']):
                 elements.append(element)
-            
-            # Recursively process children
-            elements.extend(self._parse_ui_elements(child, element_path))
-        
+
         return elements
     
+    def _build_arrays(self, elements: List[Dict]) -> Dict:
+        """Pack element attributes into structure-of-arrays form.
+
+        Downstream consumers can filter and rank elements with
+        vectorized numpy ops instead of per-dict Python loops.
+
+        Args:
+            elements: Parsed UI element dictionaries
+
+        Returns:
+            Dictionary of parallel numpy arrays
+        """
+        if not elements:
+            return {
+                'bounds': np.empty((0, 4), dtype=np.int32),
+                'centers': np.empty((0, 2), dtype=np.int32),
+                'clickable': np.empty(0, dtype=bool),
+                'text_lengths': np.empty(0, dtype=np.int32)
+            }
+
+        bounds = np.asarray(
+            [
+                (e['bounds']['x1'], e['bounds']['y1'],
+                 e['bounds']['x2'], e['bounds']['y2'])
+                for e in elements
+            ],
+            dtype=np.int32
+        )
+
+        return {
+            'bounds': bounds,
+            'centers': (bounds[:, :2] + bounds[:, 2:]) // 2,
+            'clickable': np.asarray(
+                [e['clickable'] for e in elements], dtype=bool
+            ),
+            'text_lengths': np.asarray(
+                [len(e['text']) or len(e['content_desc']) for e in elements],
+                dtype=np.int32
+            )
+        }
+
     def _parse_bounds(self, bounds_str: str) -> Dict:
         """Parse bounds string to coordinates.
         
@@ -184,17 +379,12 @@ class PerceptionModule:
         Returns:
             Dictionary with x1, y1, x2, y2 coordinates
         """
-        try:
-            # Remove brackets and split
-            coords = bounds_str.replace('][', ',').replace('[', '').replace(']', '').split(',')
-            return {
-                'x1': int(coords[0]),
-                'y1': int(coords[1]),
-                'x2': int(coords[2]),
-                'y2': int(coords[3])
-            }
-        except:
+        match = _BOUNDS_RE.match(bounds_str)
+        if not match:
             return {'x1': 0, 'y1': 0, 'x2': 0, 'y2': 0}
+
+        x1, y1, x2, y2 = map(int, match.groups())
+        return {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
     
     def _calculate_center(self, bounds: Dict) -> Dict:
         """Calculate center point of bounds.
@@ -210,22 +400,84 @@ class PerceptionModule:
             'y': (bounds['y1'] + bounds['y2']) // 2
         }
     
+    def _get_screen_size(self) -> Optional[tuple]:
+        """Return the device screen size as (width, height).
+
+        Queried once via 'wm size' and memoized, so callers that only
+        need dimensions do not depend on decoding a screenshot.
+
+        Returns:
+            (width, height) tuple, or None if the query failed
+        """
+        if self._screen_size is None:
+            try:
+                output = self._shell('wm size')
+                match = re.search(r'(\d+)x(\d+)', output)
+                if match:
+                    self._screen_size = (
+                        int(match.group(1)), int(match.group(2))
+                    )
+            except Exception as e:
+                self.logger.debug(f"Screen size query failed: {e}")
+
+        return self._screen_size
+
+    def wait_until_idle(self, max_ms: int = 1500, poll_interval: float = 0.05) -> bool:
+        """Wait until the foreground window stops changing.
+
+        Polls the current window focus and returns as soon as two
+        consecutive reads match, instead of always paying a fixed
+        worst-case delay.
+
+        Args:
+            max_ms: Maximum time to wait in milliseconds
+            poll_interval: Delay between polls in seconds
+
+        Returns:
+            True if the UI settled within the budget, False on timeout
+        """
+        deadline = time.time() + max_ms / 1000.0
+        previous = None
+
+        while time.time() < deadline:
+            try:
+                focus = self._shell('dumpsys window | grep mCurrentFocus')
+            except Exception as e:
+                self.logger.debug(f"Idle poll failed: {e}")
+                break
+
+            if previous is not None and focus == previous:
+                return True
+
+            previous = focus
+            time.sleep(poll_interval)
+
+        return False
+
     def capture_screen_state(self) -> Dict:
         """Capture complete screen state including screenshot and UI hierarchy.
         
         Returns:
             Dictionary containing screen information
         """
-        screenshot = self.capture_screenshot()
-        ui_hierarchy = self.extract_ui_hierarchy()
-        
+        # The two ADB round-trips are independent, so run them on two
+        # threads and pay only the slower of the two latencies
+        screenshot_future = self._capture_pool.submit(self.capture_screenshot)
+        hierarchy_future = self._capture_pool.submit(self.extract_ui_hierarchy)
+
+        screenshot = screenshot_future.result()
+        ui_hierarchy = hierarchy_future.result()
+
         return {
             'screenshot': screenshot,
             'ui_hierarchy': ui_hierarchy,
-            'screen_size': screenshot.size,
+            'screen_size': self._get_screen_size() or screenshot.size,
             'timestamp': time.time()
         }
     
     def cleanup(self):
         """Cleanup resources."""
+        self.stop_stream()
+        self._save_pool.shutdown(wait=False)
+        self._capture_pool.shutdown(wait=False)
         self.logger.info("Perception module cleanup completed")
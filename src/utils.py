@@ -1,23 +1,220 @@
 """Utility functions for the automation agent."""
 
+import atexit
+import itertools
 import logging
+import mmap
+import os
+import queue
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+import yaml
+
+
+# libyaml's C parser when the yaml package was built against it; falls
+# back to the pure-Python SafeLoader otherwise
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Parsed configs keyed by (resolved path, mtime); an unchanged file is
+# returned without re-reading or re-parsing it
+_CONFIG_CACHE: dict = {}
+
+
+def _freeze(obj):
+    """Recursively wrap parsed config values in read-only views.
+
+    Cached configs are shared between callers, so dicts become
+    MappingProxyType views and lists become tuples: reads stay
+    zero-copy and accidental mutation raises instead of silently
+    leaking into every later load_config call.
+
+    Args:
+        obj: Parsed YAML value
+
+    Returns:
+        Immutable view of the value
+    """
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def load_config(config_path) -> Mapping:
+    """Load a YAML configuration file.
+
+    Results are memoized by path and modification time, so repeated
+    calls for an unchanged file skip the read and parse entirely while
+    edits are still picked up. The returned mapping is read-only; it
+    is shared with every other caller of the same file.
+
+    Args:
+        config_path: Path to the YAML config file
+
+    Returns:
+        Parsed configuration as a read-only mapping
+    """
+    config_file = Path(config_path)
+    key = (str(config_file.resolve()), config_file.stat().st_mtime_ns)
+
+    config = _CONFIG_CACHE.get(key)
+    if config is None:
+        with open(config_file, 'r') as f:
+            config = _freeze(yaml.load(f, Loader=_YAML_LOADER))
+        _CONFIG_CACHE[key] = config
+
+    return config
+
+
+# Single shared Formatter: format-string parsing happens once at
+# import instead of on every setup_logger call
+_FMT = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# One async handler (and file descriptor) per log path, shared by
+# every logger that asks for it
+_FILE_HANDLERS: dict = {}
+
+
+class MmapFileHandler(logging.Handler):
+    """Log handler appending formatted records into a memory-mapped file.
+
+    A write() per record costs syscall and page-cache accounting time;
+    copying into a pre-mapped region costs hundreds of nanoseconds and
+    lets the kernel write pages back on its own schedule. The backing
+    file is truncated to capacity up front and doubled (then remapped)
+    when exhausted; close() trims it back to the bytes actually
+    written.
+    """
+
+    def __init__(self, filename, capacity: int = 1 << 20):
+        super().__init__()
+        self._fd = os.open(str(filename), os.O_RDWR | os.O_CREAT, 0o644)
+        self._pos = os.fstat(self._fd).st_size
+        self._size = max(capacity, self._pos * 2)
+        os.ftruncate(self._fd, self._size)
+        self._mmap = mmap.mmap(self._fd, self._size)
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + '\n').encode('utf-8')
+            end = self._pos + len(data)
+            if end > self._size:
+                self._grow(end)
+            self._mmap[self._pos:end] = data
+            self._pos = end
+        except Exception:
+            self.handleError(record)
+
+    def _grow(self, needed: int):
+        """Double the backing file until it fits and remap."""
+        while self._size < needed:
+            self._size *= 2
+        self._mmap.close()
+        os.ftruncate(self._fd, self._size)
+        self._mmap = mmap.mmap(self._fd, self._size)
+
+    def close(self):
+        try:
+            if self._mmap is not None:
+                self._mmap.flush()
+                self._mmap.close()
+                self._mmap = None
+                os.ftruncate(self._fd, self._pos)
+                os.close(self._fd)
+        finally:
+            super().close()
+
+
+def _get_file_handler(log_file, use_mmap: bool = False) -> QueueHandler:
+    """Return the shared asynchronous handler for a log path.
+
+    Logging through the returned QueueHandler is an O(1) enqueue on
+    the caller's thread; a daemon QueueListener drains the queue into
+    a single FileHandler per path, so file write syscalls never run on
+    the hot path.
+
+    The first call for a path fixes its handler type — two writers
+    appending to one file would interleave corruptly — so a later call
+    requesting a different use_mmap gets the existing handler and a
+    warning rather than a second writer.
+
+    Args:
+        log_file: Log file path
+        use_mmap: Append via MmapFileHandler instead of FileHandler
+
+    Returns:
+        QueueHandler feeding the path's listener
+    """
+    key = str(log_file)
+    cached = _FILE_HANDLERS.get(key)
+
+    if cached is not None:
+        handler, cached_mmap = cached
+        if cached_mmap != use_mmap:
+            logging.getLogger(__name__).warning(
+                f"Log file {key} is already configured with "
+                f"use_mmap={cached_mmap}; ignoring use_mmap={use_mmap}"
+            )
+        return handler
+
+    if use_mmap:
+        file_handler = MmapFileHandler(log_file)
+    else:
+        file_handler = logging.FileHandler(log_file)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(_FMT)
+
+    # Coalesce the listener's writes: records accumulate in memory
+    # and hit the file as one large write per 1024 records (or
+    # immediately on ERROR), not one syscall per record
+    buffered_handler = MemoryHandler(
+        1024, flushLevel=logging.ERROR, target=file_handler
+    )
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue, buffered_handler, respect_handler_level=True
+    )
+    listener.start()
+
+    # LIFO: stop the listener (draining the queue) before the
+    # buffer flushes and closes, so shutdown loses no records
+    atexit.register(buffered_handler.close)
+    atexit.register(listener.stop)
+
+    handler = QueueHandler(log_queue)
+    handler.setLevel(logging.DEBUG)
+    _FILE_HANDLERS[key] = (handler, use_mmap)
+
+    return handler
 
 
 def setup_logger(
     name: str,
     level: str = 'INFO',
-    log_file: Optional[Path] = None
+    log_file: Optional[Path] = None,
+    mmap_log: bool = False
 ) -> logging.Logger:
     """Setup a logger with consistent formatting.
-    
+
     Args:
         name: Logger name
         level: Logging level (DEBUG, INFO, WARNING, ERROR)
         log_file: Optional log file path
-        
+        mmap_log: Append log records via a memory-mapped file
+
     Returns:
         Configured logger
     """
@@ -28,42 +225,175 @@ def setup_logger(
     if logger.handlers:
         return logger
     
-    # Console handler
+    # Console handler, using the shared module-level formatter
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.DEBUG)
-    
-    # Formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(_FMT)
     logger.addHandler(console_handler)
     
-    # File handler if specified
+    # File handler if specified, reused across loggers so repeated
+    # setup calls never open a second descriptor to the same file
     if log_file:
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(_get_file_handler(log_file, use_mmap=mmap_log))
     
     return logger
 
 
+# Report skeleton templates, prebound once so the per-report loop only
+# does substitution
+_REPORT_HEADER = (
+    "# Task Report\n\n"
+    "**Task**: {task}\n\n"
+    "**Result**: {result}\n\n"
+    "**Steps**: {step_count}\n\n"
+    "## Actions\n\n"
+).format
+_REPORT_STEP = "- {status} Step {step}: {type} {description}\n".format
+
+# Status glyphs indexed by success flag, replacing a conditional and
+# literal lookup per record
+_STATUS = ('✗', '✓')
+_RESULT = ('❌ Failed', '✅ Success')
+
+# Directories already created this process, so mkdir's stat round-trip
+# runs once per directory instead of once per report
+_ensured_dirs: set = set()
+
+# Second-granularity timestamps collide under fast batch runs; the
+# counter keeps filenames unique without finer-grained clock calls
+_report_counter = itertools.count()
+
+# Filename timestamp format, kept as a constant so the hot path is a
+# single time.strftime call with no datetime object allocation
+_TIMESTAMP_FMT = '%Y%m%d_%H%M%S'
+
+
+def save_task_report(
+    task_description: str,
+    steps: list,
+    success: bool,
+    output_dir: str = 'reports'
+) -> Path:
+    """Save a Markdown report for a completed task.
+
+    The whole report is assembled in memory and written with a single
+    write call rather than one write per line.
+
+    Args:
+        task_description: The task that was executed
+        steps: Action history records for the task
+        success: Whether the task completed
+        output_dir: Directory to write the report into
+
+    Returns:
+        Path to the written report file
+    """
+    output_path = Path(output_dir)
+    if output_dir not in _ensured_dirs:
+        output_path.mkdir(exist_ok=True)
+        _ensured_dirs.add(output_dir)
+
+    timestamp = time.strftime(_TIMESTAMP_FMT)
+    report_file = output_path / (
+        f"task_report_{timestamp}_{next(_report_counter)}.md"
+    )
+
+    parts = [_REPORT_HEADER(
+        task=task_description,
+        result=_RESULT[success],
+        step_count=len(steps)
+    )]
+
+    for record in steps:
+        action = record.get('action', {})
+        parts.append(_REPORT_STEP(
+            status=_STATUS[bool(record.get('success'))],
+            step=record.get('step', '?'),
+            type=action.get('type', 'unknown'),
+            description=action.get('description', '')
+        ))
+
+    # Encode once and issue a single write() on a raw descriptor,
+    # skipping the io buffering and text-encoding layers entirely
+    buf = ''.join(parts).encode('utf-8')
+    fd = os.open(report_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, memoryview(buf))
+    finally:
+        os.close(fd)
+
+    return report_file
+
+
+def save_task_reports_batch(reports: list) -> list:
+    """Save several task reports concurrently.
+
+    Formatting runs on worker threads and the GIL releases during each
+    write, so bulk runs overlap formatting with disk I/O instead of
+    paying them serially.
+
+    Args:
+        reports: Sequence of (task_description, steps, success) tuples
+
+    Returns:
+        List of written report paths, in input order
+    """
+    if len(reports) <= 1:
+        return [save_task_report(*report) for report in reports]
+
+    with ThreadPoolExecutor(
+        max_workers=min(8, os.cpu_count() or 1)
+    ) as pool:
+        return list(pool.map(lambda r: save_task_report(*r), reports))
+
+
+# Coordinate strings look like '100,200'; compiled once so malformed
+# input is a failed match, not exception machinery
+_COORD_RE = re.compile(r'\s*(-?\d+)\s*,\s*(-?\d+)\s*\Z')
+
+
 def parse_coordinates(coord_str: str) -> tuple:
     """Parse coordinate string like '100,200' to tuple.
-    
+
     Args:
         coord_str: Coordinate string
-        
+
     Returns:
-        Tuple of (x, y)
+        Tuple of (x, y), or (0, 0) for malformed input
     """
-    try:
-        x, y = map(int, coord_str.split(','))
-        return (x, y)
-    except:
+    match = _COORD_RE.match(coord_str)
+    if match is None:
         return (0, 0)
+    return (int(match.group(1)), int(match.group(2)))
+
+
+def parse_coordinates_batch(coord_strs: Sequence[str]) -> np.ndarray:
+    """Parse many coordinate strings into one (N, 2) int32 array.
+
+    When every entry matches the coordinate pattern, a single
+    preallocated np.fromiter drives the parse; otherwise it falls back
+    to per-string parsing, where bad entries become (0, 0) like
+    parse_coordinates. Validating up front matters: trusting fromiter
+    alone would let a 'x,y,z' entry shift its extra values into the
+    following rows instead of failing.
+
+    Args:
+        coord_strs: Sequence of 'x,y' coordinate strings
+
+    Returns:
+        (N, 2) int32 array of coordinates
+    """
+    if all(_COORD_RE.match(s) for s in coord_strs):
+        flat = np.fromiter(
+            (int(v) for s in coord_strs for v in s.split(',')),
+            dtype=np.int32,
+            count=2 * len(coord_strs)
+        )
+        return flat.reshape(-1, 2)
+
+    return np.asarray(
+        [parse_coordinates(s) for s in coord_strs], dtype=np.int32
+    )
 
 
 def format_action_history(history: list, max_items: int = 5) -> str:
@@ -76,12 +406,48 @@ def format_action_history(history: list, max_items: int = 5) -> str:
     Returns:
         Formatted string
     """
-    recent = history[-max_items:] if len(history) > max_items else history
-    
-    formatted = "Action History:\n"
-    for record in recent:
-        action = record['action']
-        status = '✓' if record['success'] else '✗'
-        formatted += f"  {status} Step {record['step']}: {action['type']}\n"
-    
-    return formatted
+    # islice keeps this working for deque-backed histories, which do
+    # not support slicing, without copying the tail for lists either
+    recent = itertools.islice(history, max(0, len(history) - max_items), None)
+
+    return ''.join(
+        ["Action History:\n"] +
+        [
+            f"  {_STATUS[record['success']]} "
+            f"Step {record['step']}: {record['action']['type']}\n"
+            for record in recent
+        ]
+    )
+
+
+def format_action_history_soa(
+    steps: Sequence[int],
+    action_types: Sequence[str],
+    successes: Sequence[bool],
+    max_items: int = 5
+) -> str:
+    """Format action history kept as parallel sequences.
+
+    Structure-of-arrays callers avoid one dict per record; the
+    formatter just zips the three sequences' tails.
+
+    Args:
+        steps: Step numbers
+        action_types: Action type per step
+        successes: Success flag per step
+        max_items: Maximum items to include
+
+    Returns:
+        Formatted string
+    """
+    start = max(0, len(steps) - max_items)
+
+    return ''.join(
+        ["Action History:\n"] +
+        [
+            f"  {_STATUS[success]} Step {step}: {action_type}\n"
+            for step, action_type, success in zip(
+                steps[start:], action_types[start:], successes[start:]
+            )
+        ]
+    )